@@ -9,7 +9,7 @@
 Este módulo actúa como el Recolector dentro del sistema distribuido Montecarlo.
 Su función principal es:
 
-1. Escuchar los resultados enviados por los consumidores desde la cola 'result_queue'.
+1. Escuchar los resultados (MessagePack) enviados por los consumidores desde la cola 'result_queue'.
 2. Guardar cada resultado en un archivo de texto dentro de la carpeta 'resultados/'.
 3. Calcular estadísticas básicas (mínimo, máximo, promedio y total).
 4. Reenviar los resultados al Dashboard mediante la cola 'dashboard_queue' para su visualización.
@@ -18,11 +18,12 @@ El Recolector puede ejecutarse en una máquina independiente y funciona como pun
 central de consolidación de la información procesada.
 """
 
-import pika
-import json
+import asyncio
+import aio_pika
+import msgpack
 import os
 import time
-import statistics
+import math
 from datetime import datetime
 
 # ---------------- CONFIGURACIÓN ----------------
@@ -30,6 +31,17 @@ RABBITMQ_HOST = "IP_SERVIDOR"
 RABBITMQ_USER = "NOMBRE_HOST"
 RABBITMQ_PASS = "12345"
 RESULTS_DIR = "resultados"
+PREFETCH = 128          # mensajes en vuelo permitidos por el bróker
+LOTE_ACK = 64           # resultados reenviados y confirmados en un solo lote
+INTERVALO_ACK = 1.0     # segundos máximos que un lote parcial espera su envío
+LINEAS_POR_VOLCADO = 256    # líneas escritas antes de volcar el archivo a disco
+INTERVALO_VOLCADO = 2.0     # segundos máximos entre volcados del archivo
+
+# Argumentos comunes de cada aio_pika.Message enviado al dashboard (cada envío crea su propio mensaje)
+PROPIEDADES_DASHBOARD = {
+    "delivery_mode": aio_pika.DeliveryMode.PERSISTENT,
+    "content_type": "application/msgpack",
+}
 
 # ------------------------------------------------------------
 class ResultCollector:
@@ -41,9 +53,21 @@ class ResultCollector:
         self.user = input(f"Usuario RabbitMQ [{RABBITMQ_USER}]: ") or RABBITMQ_USER
         self.password = input(f"Contraseña RabbitMQ [{RABBITMQ_PASS}]: ") or RABBITMQ_PASS
 
-        self.resultados = []
+        # Estadísticas acumuladas en línea (algoritmo de Welford)
+        self.total = 0
+        self.promedio = 0.0
+        self._m2 = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self.conexion = None
+        self.canal = None
+        self._lote = []  # (mensaje, lineas, valores, envios) de cada mensaje sin confirmar
+        self._conteo_pendiente = 0
+        self._lock_lote = asyncio.Lock()
+        self._lineas_sin_volcar = 0
+        self._ts_seg = 0
+        self._ts_texto = ""
         self._iniciar_archivo()
-        self._conectar()
 
     # ------------------------------------------------------------
     def _iniciar_archivo(self):
@@ -51,93 +75,234 @@ class ResultCollector:
         os.makedirs(RESULTS_DIR, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.archivo_path = os.path.join(RESULTS_DIR, f"resultados_{timestamp}.txt")
-        self.archivo = open(self.archivo_path, "w", encoding="utf-8")
+        self.archivo = open(self.archivo_path, "wb", buffering=1 << 20)
         print(f"Archivo de resultados creado: {self.archivo_path}")
 
     # ------------------------------------------------------------
-    def _conectar(self):
+    async def _conectar(self):
         """Establece la conexión con RabbitMQ y prepara las colas necesarias."""
         print("Conectando con RabbitMQ...")
-        cred = pika.PlainCredentials(self.user, self.password)
-        params = pika.ConnectionParameters(host=self.host, credentials=cred)
-        self.conexion = pika.BlockingConnection(params)
-        self.canal = self.conexion.channel()
-        self.canal.queue_declare(queue="result_queue", durable=True)
-        self.canal.queue_declare(queue="dashboard_queue", durable=True)
+        self.conexion = await aio_pika.connect_robust(
+            host=self.host, login=self.user, password=self.password,
+            timeout=5, heartbeat=30
+        )
+        # Publisher confirms: cada publicación devuelve un awaitable que se resuelve
+        # cuando el bróker la confirma, así que un lote entero puede esperarse a la vez
+        self.canal = await self.conexion.channel(publisher_confirms=True)
+        await self.canal.set_qos(prefetch_count=PREFETCH)
+        self.cola_resultados = await self.canal.declare_queue("result_queue", durable=True)
+        await self.canal.declare_queue("dashboard_queue", durable=True)
         print(f"Conectado a RabbitMQ en {self.host}")
 
     # ------------------------------------------------------------
-    def _procesar_resultado(self, canal, metodo, propiedades, cuerpo):
-        """Procesa un mensaje recibido desde 'result_queue'."""
+    async def _procesar_resultado(self, mensaje):
+        """
+        Procesa un mensaje recibido desde 'result_queue'. El mensaje puede
+        contener un lote de resultados (lista) o un único resultado (dict).
+        """
         try:
-            msg = json.loads(cuerpo.decode())
-            resultado = msg.get("resultado")
-            escenario = msg.get("escenario", {})
-            worker = msg.get("worker_id", "desconocido")
-            timestamp = datetime.now().strftime("%H:%M:%S")
-
-            # Guardar resultado en archivo
-            linea = f"[{timestamp}] {worker} -> Escenario: {escenario} => Resultado: {resultado:.4f}\n"
-            self.archivo.write(linea)
-            self.archivo.flush()
+            mensajes = msgpack.unpackb(mensaje.body, raw=False)
+            if isinstance(mensajes, dict):
+                mensajes = [mensajes]
+            timestamp = self._hora_actual()
+
+            # Preparar todo el mensaje antes de tocar los búferes, para que un
+            # resultado inválido no deje el lote a medias
+            lineas, valores, envios = [], [], []
+            for msg in mensajes:
+                resultado = msg.get("resultado")
+                escenario = msg.get("escenario", {})
+                worker = msg.get("worker_id", "desconocido")
+
+                linea = f"[{timestamp}] {worker} -> Escenario: {escenario} => Resultado: {resultado:.4f}\n"
+                lineas.append(linea.encode("utf-8"))
+                valores.append(resultado)
+
+                msg_dashboard = {
+                    "worker_id": worker,
+                    "resultado": resultado,
+                    "timestamp": timestamp
+                }
+                envios.append(msgpack.packb(msg_dashboard, use_bin_type=True))
 
-            # Acumular resultado en memoria
-            self.resultados.append(resultado)
-            print(f"Resultado recibido: {resultado:.4f} (total: {len(self.resultados)})")
-
-            # Enviar al dashboard
-            msg_dashboard = {
-                "worker_id": worker,
-                "resultado": resultado,
-                "timestamp": timestamp
-            }
-            self.canal.basic_publish(
-                exchange="",
-                routing_key="dashboard_queue",
-                body=json.dumps(msg_dashboard),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-
-            canal.basic_ack(delivery_tag=metodo.delivery_tag)
+            print(f"Resultados recibidos: {len(valores)} (total confirmado: {self.total})")
 
         except Exception as e:
             print(f"Error procesando resultado: {e}")
-            canal.basic_nack(delivery_tag=metodo.delivery_tag)
+            await mensaje.nack()
+            return
+
+        # Las líneas se escriben, los envíos al dashboard se publican y las
+        # estadísticas se actualizan al confirmar el lote
+        self._lote.append((mensaje, lineas, valores, envios))
+        self._conteo_pendiente += len(valores)
+        if self._conteo_pendiente >= LOTE_ACK:
+            await self._confirmar_lote()
 
     # ------------------------------------------------------------
-    def iniciar(self):
-        """Comienza a escuchar la cola de resultados."""
+    def _canal_vigente(self, mensaje):
+        """
+        Indica si el canal por el que llegó el mensaje sigue abierto. Si se cerró
+        (p. ej. antes de una reconexión), el bróker ya reencoló el mensaje y
+        volverá a llegar, así que escribirlo o publicarlo ahora lo duplicaría.
+        """
+        try:
+            mensaje.channel
+        except aio_pika.exceptions.ChannelInvalidStateError:
+            return False
+        return True
+
+    # ------------------------------------------------------------
+    def _hora_actual(self):
+        """Devuelve la hora HH:MM:SS, formateándola solo cuando cambia el segundo."""
+        segundo = int(time.time())
+        if segundo != self._ts_seg:
+            self._ts_seg = segundo
+            self._ts_texto = time.strftime("%H:%M:%S", time.localtime(segundo))
+        return self._ts_texto
+
+    # ------------------------------------------------------------
+    def _actualizar_estadisticas(self, valores):
+        """Actualiza total, promedio, varianza, mínimo y máximo sin guardar los valores."""
+        for valor in valores:
+            self.total += 1
+            delta = valor - self.promedio
+            self.promedio += delta / self.total
+            self._m2 += delta * (valor - self.promedio)
+            if valor < self.minimo:
+                self.minimo = valor
+            if valor > self.maximo:
+                self.maximo = valor
+
+    # ------------------------------------------------------------
+    async def _confirmar_lote(self):
+        """
+        Publica en 'dashboard_queue' los mensajes acumulados, espera a la vez
+        todas sus confirmaciones y después confirma los originales con un solo
+        ack. Si alguna publicación falla, los mensajes del lote se devuelven a
+        'result_queue'; si todo va bien, sus valores entran en las estadísticas
+        y sus líneas se escriben en el archivo.
+        """
+        if not self._lote:
+            return
+        # Tomar el lote actual; lo que llegue mientras se publica forma el siguiente
+        lote, self._lote = self._lote, []
+        self._conteo_pendiente = 0
+
+        # Los lotes se cierran en orden: un ack múltiple no debe adelantarse al lote anterior
+        async with self._lock_lote:
+            # Se descartan solo los mensajes de canales ya cerrados; el ack múltiple
+            # del último mensaje vigente cubre únicamente los de su propio canal
+            lote = [entrada for entrada in lote if self._canal_vigente(entrada[0])]
+            if not lote:
+                return
+            pendiente = lote[-1][0]
+            envios = [cuerpo for _, _, _, cuerpos in lote for cuerpo in cuerpos]
+            try:
+                await asyncio.gather(*(
+                    self.canal.default_exchange.publish(
+                        aio_pika.Message(body=cuerpo, **PROPIEDADES_DASHBOARD),
+                        routing_key="dashboard_queue"
+                    )
+                    for cuerpo in envios
+                ))
+                await pendiente.ack(multiple=True)
+                # Solo se cuentan los resultados confirmados: un lote devuelto volverá a llegar
+                self._actualizar_estadisticas(v for _, _, valores, _ in lote for v in valores)
+                self._escribir_lineas([l for _, lineas, _, _ in lote for l in lineas])
+            except (aio_pika.exceptions.AMQPError, aio_pika.exceptions.ChannelInvalidStateError) as e:
+                print(f"Error enviando lote al dashboard: {e}")
+                # Si el canal del mensaje sigue abierto se devuelven explícitamente; si
+                # se cerró (p. ej. tras una reconexión), el bróker ya los reencoló.
+                try:
+                    await pendiente.nack(multiple=True, requeue=True)
+                except aio_pika.exceptions.ChannelInvalidStateError:
+                    pass
+
+    # ------------------------------------------------------------
+    async def _confirmar_periodicamente(self):
+        """Evita que un lote incompleto quede sin confirmar cuando baja el tráfico."""
+        while True:
+            await asyncio.sleep(INTERVALO_ACK)
+            try:
+                await self._confirmar_lote()
+            except Exception as e:
+                print(f"Error en la confirmación periódica: {e}")
+
+    # ------------------------------------------------------------
+    def _escribir_lineas(self, lineas):
+        """Escribe con una sola llamada todas las líneas del lote confirmado."""
+        self.archivo.writelines(lineas)
+        self._lineas_sin_volcar += len(lineas)
+        if self._lineas_sin_volcar >= LINEAS_POR_VOLCADO:
+            self._volcar_archivo()
+
+    # ------------------------------------------------------------
+    def _volcar_archivo(self):
+        """Vacía hacia el sistema operativo las líneas que siguen en el búfer del archivo."""
+        if self._lineas_sin_volcar:
+            self.archivo.flush()
+            self._lineas_sin_volcar = 0
+
+    # ------------------------------------------------------------
+    async def _volcar_periodicamente(self):
+        """Garantiza que los resultados salgan del búfer aunque el tráfico sea bajo."""
+        while True:
+            await asyncio.sleep(INTERVALO_VOLCADO)
+            try:
+                self._volcar_archivo()
+            except Exception as e:
+                print(f"Error en el volcado periódico: {e}")
+
+    # ------------------------------------------------------------
+    async def _ejecutar(self):
+        """Conecta, consume 'result_queue' hasta que se interrumpe y cierra la conexión."""
+        await self._conectar()
+        await self.cola_resultados.consume(self._procesar_resultado)
+        tareas = [
+            asyncio.create_task(self._confirmar_periodicamente()),
+            asyncio.create_task(self._volcar_periodicamente()),
+        ]
         print("Escuchando resultados en 'result_queue'...")
-        self.canal.basic_qos(prefetch_count=1)
-        self.canal.basic_consume(queue="result_queue", on_message_callback=self._procesar_resultado)
 
         try:
-            self.canal.start_consuming()
+            await asyncio.Future()  # el bucle de eventos atiende los mensajes hasta Ctrl+C
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+            try:
+                await self._confirmar_lote()
+            except Exception as e:
+                print(f"No se pudo confirmar el último lote: {e}")
+            await self.conexion.close()
+
+    # ------------------------------------------------------------
+    def iniciar(self):
+        """Comienza a escuchar la cola de resultados."""
+        try:
+            asyncio.run(self._ejecutar())
         except KeyboardInterrupt:
             print("\nFinalizando ejecución...")
             self._cerrar()
 
     # ------------------------------------------------------------
     def _cerrar(self):
-        """Cierra el archivo, muestra estadísticas y termina la conexión."""
-        if self.resultados:
-            prom = statistics.mean(self.resultados)
-            minimo = min(self.resultados)
-            maximo = max(self.resultados)
+        """Cierra el archivo y muestra estadísticas (la conexión ya se cerró en _ejecutar)."""
+        if self.total:
+            desviacion = math.sqrt(self._m2 / (self.total - 1)) if self.total > 1 else 0.0
 
             print("\nEstadísticas finales de resultados:")
-            print(f"   Total: {len(self.resultados)}")
-            print(f"   Promedio: {prom:.4f}")
-            print(f"   Mínimo: {minimo:.4f}")
-            print(f"   Máximo: {maximo:.4f}")
+            print(f"   Total: {self.total}")
+            print(f"   Promedio: {self.promedio:.4f}")
+            print(f"   Desviación estándar: {desviacion:.4f}")
+            print(f"   Mínimo: {self.minimo:.4f}")
+            print(f"   Máximo: {self.maximo:.4f}")
         else:
             print("\nNo se recibieron resultados durante la ejecución.")
 
+        self._volcar_archivo()
         self.archivo.close()
 
-        if self.conexion and not self.conexion.is_closed:
-            self.conexion.close()
-
         print(f"Conexión cerrada. Resultados guardados en '{self.archivo_path}'.")
         print("Ejecución finalizada correctamente.")
 
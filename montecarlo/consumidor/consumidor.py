@@ -19,10 +19,22 @@ lo que permite distribuir la carga de trabajo de forma concurrente.
 """
 
 import pika
-import json
+import orjson
+import msgpack
 import time
 import math
 
+# ---------------- CONFIGURACIÓN ----------------
+PREFETCH = 4            # mensajes (paquetes de escenarios) en vuelo permitidos por el bróker
+LOTE_ACK = 2            # mensajes confirmados con un solo basic_ack (debe ser menor que PREFETCH)
+INTERVALO_ACK = 1.0     # segundos máximos que un lote parcial espera su ack
+
+# Propiedades de los mensajes de resultados: una sola instancia compartida (no modificar)
+PROPIEDADES_RESULTADO = pika.BasicProperties(content_type="application/msgpack")
+
+# Espacio global con el que se evalúa el modelo (compartido entre escenarios)
+GLOBALES_MODELO = {"math": math}
+
 class ConsumidorMontecarlo:
     """Clase que implementa el comportamiento de un consumidor Montecarlo."""
 
@@ -36,7 +48,11 @@ class ConsumidorMontecarlo:
         self.worker_id = input("Nombre del consumidor (ej. VM1, LaptopA): ") or "Anon"
 
         self.modelo = None
+        self._codigo_modelo = None
+        self._constantes = {}
         self.resultados_publicados = 0
+        self._tag_pendiente = None
+        self._conteo_pendiente = 0
         self.conectar()
 
     # ------------------------------------------------------------
@@ -44,7 +60,11 @@ class ConsumidorMontecarlo:
         """Establece conexión con RabbitMQ y prepara las colas necesarias."""
         print("Conectando con RabbitMQ...")
         credenciales = pika.PlainCredentials(self.rabbit_user, self.rabbit_pass)
-        parametros = pika.ConnectionParameters(host=self.rabbit_host, credentials=credenciales)
+        # pika ya desactiva Nagle (TCP_NODELAY); aquí se acotan los tiempos de espera de red
+        parametros = pika.ConnectionParameters(
+            host=self.rabbit_host, credentials=credenciales,
+            tcp_options={"TCP_USER_TIMEOUT": 30000}, socket_timeout=5, heartbeat=30
+        )
         self.conexion = pika.BlockingConnection(parametros)
         self.canal = self.conexion.channel()
 
@@ -62,7 +82,15 @@ class ConsumidorMontecarlo:
         metodo, propiedades, cuerpo = self.canal.basic_get(queue="model_queue", auto_ack=True)
 
         if cuerpo:
-            self.modelo = json.loads(cuerpo.decode())
+            self.modelo = orjson.loads(cuerpo)
+            # Compilar la expresión una sola vez; cada escenario solo ejecuta el bytecode
+            expresion = self.modelo["model"].replace("resultado =", "").strip()
+            try:
+                self._codigo_modelo = compile(expresion, "<modelo>", "eval")
+            except SyntaxError as e:
+                print(f"Modelo inválido: {e}")
+                exit(1)
+            self._constantes = dict(self.modelo.get("constants", {}))
             print("Modelo recibido y cargado correctamente.")
         else:
             print("No hay modelo disponible en la cola. Finalizando proceso.")
@@ -74,41 +102,66 @@ class ConsumidorMontecarlo:
         Ejecuta el modelo usando los valores del escenario.
         Combina las variables del escenario con las constantes del modelo.
         """
-        expresion = self.modelo["model"].replace("resultado =", "").strip()
         try:
-            entorno = {}
-            entorno.update(escenario)
-            entorno.update(self.modelo.get("constants", {}))
-            resultado = eval(expresion, {}, entorno)
-            return resultado
+            entorno = dict(escenario)
+            entorno.update(self._constantes)
+            return eval(self._codigo_modelo, GLOBALES_MODELO, entorno)
         except Exception as e:
             print(f"Error evaluando modelo: {e}")
             return None
 
     # ------------------------------------------------------------
     def procesar_escenario(self, canal, metodo, propiedades, cuerpo):
-        """Procesa un escenario recibido, evalúa el modelo y publica el resultado."""
-        escenario = json.loads(cuerpo.decode())
-        resultado = self.ejecutar_modelo(escenario)
-
-        if resultado is not None:
-            mensaje_resultado = {
-                "worker_id": self.worker_id,
-                "escenario": escenario,
-                "resultado": resultado,
-                "timestamp": time.time()
-            }
-
-            # Publicar resultado en la cola result_queue
+        """
+        Procesa un mensaje de escenarios, evalúa el modelo para cada uno y
+        publica todos los resultados juntos en un solo mensaje.
+        """
+        escenarios = orjson.loads(cuerpo)
+        # Un mensaje puede traer un paquete de escenarios (lista) o uno solo (dict)
+        if isinstance(escenarios, dict):
+            escenarios = [escenarios]
+
+        mensajes_resultado = []
+        for escenario in escenarios:
+            resultado = self.ejecutar_modelo(escenario)
+            if resultado is not None:
+                mensajes_resultado.append({
+                    "worker_id": self.worker_id,
+                    "escenario": escenario,
+                    "resultado": resultado,
+                    "timestamp": time.time()
+                })
+
+        if mensajes_resultado:
+            # Publicar el lote de resultados en la cola result_queue (MessagePack)
             self.canal.basic_publish(
                 exchange="",
                 routing_key="result_queue",
-                body=json.dumps(mensaje_resultado)
+                body=msgpack.packb(mensajes_resultado, use_bin_type=True),
+                properties=PROPIEDADES_RESULTADO
             )
-            self.resultados_publicados += 1
-            print(f"Resultado publicado #{self.resultados_publicados}: {resultado:.4f}")
+            self.resultados_publicados += len(mensajes_resultado)
+            print(f"Resultados publicados: {len(mensajes_resultado)} (total: {self.resultados_publicados})")
 
-        canal.basic_ack(delivery_tag=metodo.delivery_tag)
+        # Confirmar en lote: un único basic_ack(multiple=True) cada LOTE_ACK mensajes
+        self._tag_pendiente = metodo.delivery_tag
+        self._conteo_pendiente += 1
+        if self._conteo_pendiente >= LOTE_ACK:
+            self._confirmar_lote()
+
+    # ------------------------------------------------------------
+    def _confirmar_lote(self):
+        """Confirma de una sola vez todos los escenarios pendientes de ack."""
+        if self._tag_pendiente is not None:
+            self.canal.basic_ack(delivery_tag=self._tag_pendiente, multiple=True)
+            self._tag_pendiente = None
+            self._conteo_pendiente = 0
+
+    # ------------------------------------------------------------
+    def _confirmar_periodicamente(self):
+        """Evita que un lote incompleto quede sin confirmar cuando baja el tráfico."""
+        self._confirmar_lote()
+        self.conexion.call_later(INTERVALO_ACK, self._confirmar_periodicamente)
 
     # ------------------------------------------------------------
     def consumir_escenarios(self):
@@ -117,8 +170,9 @@ class ConsumidorMontecarlo:
         Cada consumidor recibe y procesa escenarios de manera independiente.
         """
         print("Esperando escenarios en 'scenario_queue'...")
-        self.canal.basic_qos(prefetch_count=1)
+        self.canal.basic_qos(prefetch_count=PREFETCH)
         self.canal.basic_consume(queue="scenario_queue", on_message_callback=self.procesar_escenario)
+        self.conexion.call_later(INTERVALO_ACK, self._confirmar_periodicamente)
         self.canal.start_consuming()
 
     # ------------------------------------------------------------
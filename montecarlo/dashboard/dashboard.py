@@ -18,10 +18,12 @@ un enfoque minimalista tipo panel de control.
 """
 
 import pygame
+import numpy as np
 import pika
-import json
+import msgpack
 import threading
-from datetime import datetime
+import functools
+import time
 import os
 
 # ---------------- CONFIGURACIÓN ----------------
@@ -30,10 +32,16 @@ RABBITMQ_USER = "NOMBRE_HOST"
 RABBITMQ_PASS = "12345"
 QUEUE_NAME = "dashboard_queue"
 RESULTS_DIR = "resultados_dashboard"
+LINEAS_POR_VOLCADO = 64     # líneas del registro acumuladas antes de volcarlas a disco
 
 SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 FPS = 30
+HISTORIAL = 200     # puntos que se conservan y grafican por consumidor
+MAX_CONSUMIDORES = 8    # filas reservadas al inicio en la matriz de historiales (crece si hace falta)
+
+# Coordenadas x de los puntos de cada gráfica (fijas, se calculan una sola vez)
+XS_GRAFICA = (np.arange(HISTORIAL) * ((SCREEN_WIDTH - 420) / HISTORIAL)).astype(np.int32) + 40
 
 # ---------------- ESTILO VISUAL ----------------
 COLOR_FONDO = (150, 158, 124)   # #969e7c
@@ -53,28 +61,69 @@ class AlmacenDatos:
     def __init__(self):
         self.datos = {}
         self.lock = threading.Lock()
+        # Historiales de todos los consumidores en una sola matriz: cada consumidor
+        # ocupa una fila usada como búfer circular (heads = próxima posición a escribir)
+        self.mat = np.zeros((MAX_CONSUMIDORES, HISTORIAL), np.float32)
+        self.heads = np.zeros(MAX_CONSUMIDORES, np.int32)
+        self.largos = np.zeros(MAX_CONSUMIDORES, np.int32)
+        # Doble búfer: el hilo de dibujo solo lee la última instantánea publicada,
+        # que se reconstruye (a lo sumo una vez por cuadro) cuando cambia la versión
+        self._version = 0
+        self._version_instantanea = -1
+        self._instantanea = ({}, self.mat[:0].copy())
 
     def agregar_resultado(self, worker_id, resultado):
         """Agrega o actualiza los datos de un consumidor."""
         with self.lock:
             if worker_id not in self.datos:
+                fila = len(self.datos)
+                if fila == len(self.mat):
+                    self._ampliar()
                 self.datos[worker_id] = {
-                    "color": COLOR_LINEAS[len(self.datos) % len(COLOR_LINEAS)],
-                    "historial": [],
+                    "color": COLOR_LINEAS[fila % len(COLOR_LINEAS)],
+                    "fila": fila,
                     "conteo": 0,
                     "ultimo": resultado
                 }
             d = self.datos[worker_id]
-            d["historial"].append(resultado)
-            if len(d["historial"]) > 200:
-                d["historial"].pop(0)
+            fila = d["fila"]
+            self.mat[fila, self.heads[fila]] = resultado
+            self.heads[fila] = (self.heads[fila] + 1) % HISTORIAL
+            if self.largos[fila] < HISTORIAL:
+                self.largos[fila] += 1
             d["conteo"] += 1
             d["ultimo"] = resultado
+            self._version += 1
+
+    def _ampliar(self):
+        """Duplica las filas de la matriz de historiales (se llama con el lock tomado)."""
+        n = len(self.mat)
+        self.mat = np.concatenate((self.mat, np.zeros((n, HISTORIAL), np.float32)))
+        self.heads = np.concatenate((self.heads, np.zeros(n, np.int32)))
+        self.largos = np.concatenate((self.largos, np.zeros(n, np.int32)))
 
     def instantanea(self):
-        """Devuelve una copia segura de los datos."""
+        """
+        Devuelve una copia independiente de los datos como (datos, historial):
+        `datos` indica por consumidor su fila y cuántos puntos tiene ("largo"),
+        e `historial` es una matriz con cada fila ya ordenada cronológicamente.
+        La copia no se modifica después de crearse, así que puede leerse sin el lock.
+        """
         with self.lock:
-            return dict(self.datos)
+            if self._version != self._version_instantanea:
+                n = len(self.datos)
+                largos = self.largos[:n]
+                # Índices que reordenan cada fila empezando por su valor más antiguo
+                inicio = (self.heads[:n] - largos) % HISTORIAL
+                indices = (inicio[:, None] + np.arange(HISTORIAL)) % HISTORIAL
+                historial = np.take_along_axis(self.mat[:n], indices, axis=1)
+                datos = {
+                    wid: dict(d, largo=int(largos[d["fila"]]))
+                    for wid, d in self.datos.items()
+                }
+                self._instantanea = (datos, historial)
+                self._version_instantanea = self._version
+            return self._instantanea
 
 # ------------------------------------------------------------
 class EscuchadorRabbit(threading.Thread):
@@ -86,34 +135,83 @@ class EscuchadorRabbit(threading.Thread):
         self.usuario = usuario
         self.contrasena = contrasena
 
+        # Registro en disco: se abre una sola vez y se vuelca cada LINEAS_POR_VOLCADO líneas
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        archivo = os.path.join(RESULTS_DIR, "resultados_dashboard.txt")
+        self._fh = open(archivo, "ab", buffering=1 << 16)
+        self._lineas_sin_volcar = 0
+        self._lock_archivo = threading.Lock()
+
     def run(self):
         cred = pika.PlainCredentials(self.usuario, self.contrasena)
-        params = pika.ConnectionParameters(host=self.host, credentials=cred)
+        # pika ya desactiva Nagle (TCP_NODELAY); aquí se acotan los tiempos de espera de red
+        params = pika.ConnectionParameters(
+            host=self.host, credentials=cred,
+            tcp_options={"TCP_USER_TIMEOUT": 30000}, socket_timeout=5, heartbeat=30
+        )
         conn = pika.BlockingConnection(params)
         canal = conn.channel()
         canal.queue_declare(queue=QUEUE_NAME, durable=True)
         print("Escuchando datos desde:", self.host)
 
-        for metodo, props, cuerpo in canal.consume(QUEUE_NAME, inactivity_timeout=1):
-            if cuerpo:
-                try:
-                    msg = json.loads(cuerpo.decode())
-                    worker_id = msg.get("worker_id", "desconocido")
-                    resultado = msg.get("resultado", 0.0)
-                    self.almacen.agregar_resultado(worker_id, resultado)
-                    canal.basic_ack(metodo.delivery_tag)
-                    guardar_resultado(worker_id, resultado)
-                except Exception as e:
-                    print("Error procesando mensaje:", e)
-        conn.close()
+        try:
+            for metodo, props, cuerpo in canal.consume(QUEUE_NAME, inactivity_timeout=1):
+                if cuerpo:
+                    try:
+                        msg = msgpack.unpackb(cuerpo, raw=False)
+                        worker_id = msg.get("worker_id", "desconocido")
+                        resultado = msg.get("resultado", 0.0)
+                        self.almacen.agregar_resultado(worker_id, resultado)
+                        canal.basic_ack(metodo.delivery_tag)
+                        self.guardar_resultado(worker_id, resultado)
+                    except Exception as e:
+                        print("Error procesando mensaje:", e)
+                else:
+                    # Sin mensajes durante un segundo: aprovechar para volcar el registro
+                    self.volcar_archivo()
+        finally:
+            self.cerrar_archivo()
+            conn.close()
+
+    def guardar_resultado(self, worker_id, resultado):
+        """Guarda los resultados visualizados también en disco local."""
+        linea = f"[{hora_texto(int(time.time()))}] {worker_id} => {resultado:.4f}\n"
+        with self._lock_archivo:
+            if self._fh.closed:
+                return
+            self._fh.write(linea.encode("utf-8"))
+            self._lineas_sin_volcar += 1
+            if self._lineas_sin_volcar >= LINEAS_POR_VOLCADO:
+                self._fh.flush()
+                self._lineas_sin_volcar = 0
+
+    def volcar_archivo(self):
+        """Vuelca a disco las líneas pendientes del registro."""
+        with self._lock_archivo:
+            if self._lineas_sin_volcar and not self._fh.closed:
+                self._fh.flush()
+                self._lineas_sin_volcar = 0
+
+    def cerrar_archivo(self):
+        """Vuelca y cierra el registro; puede llamarse desde cualquier hilo."""
+        with self._lock_archivo:
+            if not self._fh.closed:
+                self._fh.close()
+
+# ------------------------------------------------------------
+@functools.lru_cache(maxsize=4)
+def hora_texto(segundo):
+    """Hora HH:MM:SS de un instante en segundos; se formatea una vez por segundo."""
+    return time.strftime("%H:%M:%S", time.localtime(segundo))
 
 # ------------------------------------------------------------
-def guardar_resultado(worker_id, resultado):
-    """Guarda los resultados visualizados también en disco local."""
-    os.makedirs(RESULTS_DIR, exist_ok=True)
-    archivo = os.path.join(RESULTS_DIR, "resultados_dashboard.txt")
-    with open(archivo, "a", encoding="utf-8") as f:
-        f.write(f"[{datetime.now().strftime('%H:%M:%S')}] {worker_id} => {resultado:.4f}\n")
+@functools.lru_cache(maxsize=512)
+def renderizar_texto(fuente, texto, color):
+    """
+    Devuelve la superficie de un texto, renderizándola solo la primera vez.
+    Etiquetas, títulos y el reloj se repiten en muchos cuadros seguidos.
+    """
+    return fuente.render(texto, True, color)
 
 # ------------------------------------------------------------
 def dibujar_panel(screen, fuente, datos):
@@ -126,55 +224,59 @@ def dibujar_panel(screen, fuente, datos):
     y = 80
     pygame.draw.rect(screen, COLOR_CONTORNO, (x_base - 10, 40, 320, SCREEN_HEIGHT - 60), 2, border_radius=10)
 
-    texto_titulo = fuente.render("ESTADO GENERAL", True, COLOR_TITULO)
+    texto_titulo = renderizar_texto(fuente, "ESTADO GENERAL", COLOR_TITULO)
     screen.blit(texto_titulo, (x_base + 30, y)); y += 40
 
     todos = [v["ultimo"] for v in datos.values()] if datos else []
     if todos:
         promedio = sum(todos) / len(todos)
-        screen.blit(fuente.render(f"Resultados totales: {len(todos)}", True, COLOR_TEXTO), (x_base + 20, y)); y += 30
-        screen.blit(fuente.render(f"Promedio actual: {promedio:.4f}", True, COLOR_TEXTO), (x_base + 20, y)); y += 40
+        screen.blit(renderizar_texto(fuente, f"Resultados totales: {len(todos)}", COLOR_TEXTO), (x_base + 20, y)); y += 30
+        screen.blit(renderizar_texto(fuente, f"Promedio actual: {promedio:.4f}", COLOR_TEXTO), (x_base + 20, y)); y += 40
     else:
-        screen.blit(fuente.render("Esperando resultados...", True, COLOR_TEXTO), (x_base + 20, y)); y += 40
+        screen.blit(renderizar_texto(fuente, "Esperando resultados...", COLOR_TEXTO), (x_base + 20, y)); y += 40
 
-    screen.blit(fuente.render("CONSUMIDORES ACTIVOS", True, COLOR_TITULO), (x_base + 30, y)); y += 30
+    screen.blit(renderizar_texto(fuente, "CONSUMIDORES ACTIVOS", COLOR_TITULO), (x_base + 30, y)); y += 30
     for wid, info in datos.items():
         c = info["color"]
         pygame.draw.rect(screen, c, (x_base + 20, y + 10, min(220, info["conteo"] * 2), 8))
         etiqueta = f"{wid[:10]} ({info['conteo']})"
-        screen.blit(fuente.render(etiqueta, True, COLOR_TEXTO), (x_base + 20, y - 8))
+        screen.blit(renderizar_texto(fuente, etiqueta, COLOR_TEXTO), (x_base + 20, y - 8))
         y += 30
 
 # ------------------------------------------------------------
-def dibujar_graficas(screen, fuente, datos):
+def dibujar_graficas(screen, fuente, datos, historial):
     """Dibuja una línea tipo osciloscopio para cada consumidor."""
     base_y = SCREEN_HEIGHT // 2
-    for i, (worker_id, info) in enumerate(sorted(datos.items())):
+    consumidores = sorted(datos.items())
+    if not consumidores:
+        return
+
+    # Coordenadas y de todos los consumidores en una sola operación vectorizada
+    filas = [info["fila"] for _, info in consumidores]
+    offsets = np.arange(len(consumidores), dtype=np.int32) * 70 - 150
+    ys = (base_y + offsets)[:, None] - (historial[filas] % 60).astype(np.int32)
+
+    for i, (worker_id, info) in enumerate(consumidores):
         color = info["color"]
-        hist = info["historial"]
+        largo = info["largo"]
         offset = i * 70 - 150
-        if len(hist) > 2:
-            puntos = []
-            for x, v in enumerate(hist[-200:]):
-                px = int((x / 200) * (SCREEN_WIDTH - 420))
-                py = base_y + offset - int((v % 60))
-                puntos.append((px + 40, py))
-            if len(puntos) > 1:
-                pygame.draw.lines(screen, color, False, puntos, 2)
+        if largo > 2:
+            puntos = list(zip(XS_GRAFICA[:largo].tolist(), ys[i, :largo].tolist()))
+            pygame.draw.lines(screen, color, False, puntos, 2)
         etiqueta = f"{worker_id} [último={info['ultimo']:.2f}]"
-        screen.blit(fuente.render(etiqueta, True, COLOR_TEXTO), (50, base_y + offset - 45))
+        screen.blit(renderizar_texto(fuente, etiqueta, COLOR_TEXTO), (50, base_y + offset - 45))
 
 # ------------------------------------------------------------
-def dibujar_interfaz(screen, fuente, datos, tick):
+def dibujar_interfaz(screen, fuente, datos, historial, tick):
     """Dibuja la interfaz completa."""
     screen.fill(COLOR_FONDO)
     titulo_color = COLOR_TITULO if (tick // 30) % 2 == 0 else COLOR_TEXTO
-    screen.blit(fuente.render("SIMULADOR MONTECARLO", True, titulo_color), (40, 20))
+    screen.blit(renderizar_texto(fuente, "SIMULADOR MONTECARLO", titulo_color), (40, 20))
 
-    hora = datetime.now().strftime("%H:%M:%S")
-    screen.blit(fuente.render(f"{hora}", True, COLOR_TEXTO), (1100, 25))
+    hora = hora_texto(int(time.time()))
+    screen.blit(renderizar_texto(fuente, f"{hora}", COLOR_TEXTO), (1100, 25))
 
-    dibujar_graficas(screen, fuente, datos)
+    dibujar_graficas(screen, fuente, datos, historial)
     dibujar_panel(screen, fuente, datos)
 
 # ------------------------------------------------------------
@@ -198,13 +300,14 @@ def main():
                 ejecutando = False
 
         tick += 1
-        datos = almacen.instantanea()
-        dibujar_interfaz(screen, fuente, datos, tick)
+        datos, historial = almacen.instantanea()
+        dibujar_interfaz(screen, fuente, datos, historial, tick)
 
         pygame.display.flip()
         reloj.tick(FPS)
 
     pygame.quit()
+    escuchador.cerrar_archivo()
     print("Dashboard cerrado correctamente.")
 
 # ------------------------------------------------------------
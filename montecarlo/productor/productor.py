@@ -19,10 +19,11 @@ y se ejecuta en la máquina madre del sistema.
 """
 
 import os
+import math
 import pika
 import numpy as np
 import re
-import json
+import orjson
 from pathlib import Path
 
 # ---------------- CONFIGURACIÓN POR DEFECTO ----------------
@@ -30,6 +31,44 @@ RABBITMQ_HOST = "IP"
 RABBITMQ_USER = "NOMBRE HOST"
 RABBITMQ_PASS = "12345"
 MODEL_FILE = "modelo.txt"
+ESCENARIOS_POR_MENSAJE = 64  # máximo de escenarios empaquetados en cada mensaje de 'scenario_queue'
+MENSAJES_MINIMOS = 16        # mensajes (aprox.) en que se reparte una tanda pequeña
+LOTE_PUBLICACION = 16        # mensajes confirmados por el bróker con un solo tx_commit
+
+# Propiedades de los mensajes de escenarios: una sola instancia compartida (no modificar)
+PROPIEDADES_ESCENARIO = pika.BasicProperties(delivery_mode=2)
+
+# ---------------- DISTRIBUCIONES SOPORTADAS ----------------
+def _constante(rng, valor, size=None):
+    """Distribución degenerada: siempre devuelve `valor` (un escalar si no se indica `size`)."""
+    if size is None:
+        return valor
+    return np.full(size, valor)
+
+# Argumentos de cada distribución (lo que sigue al paréntesis de apertura)
+_PATRONES_DISTRIBUCION = {
+    "uniform": re.compile(r"([^,]+),\s*([^)]+)\)"),
+    "normal": re.compile(r"([^,]+),\s*([^)]+)\)"),
+    "triangular": re.compile(r"([^,]+),\s*([^,]+),\s*([^)]+)\)"),
+    "constante": re.compile(r"([^)]+)\)"),
+}
+
+# Función generadora de cada distribución; reciben el Generator como primer argumento
+_GENERADORES_DISTRIBUCION = {
+    "uniform": np.random.Generator.uniform,
+    "normal": np.random.Generator.normal,
+    "triangular": np.random.Generator.triangular,
+    "constante": _constante,
+}
+
+# Nombres admitidos en el formato JSON de lista, p. ej. ["uniforme", a, b]
+_NOMBRES_LISTA = {
+    "uniform": "uniform",
+    "uniforme": "uniform",
+    "normal": "normal",
+    "triangular": "triangular",
+    "constante": "constante",
+}
 
 # ------------------------------------------------------------
 class MonteCarloProductor:
@@ -46,8 +85,10 @@ class MonteCarloProductor:
         self.contrasena = contrasena
         self.archivo_modelo = Path(archivo_modelo)
         self.modelo = {}
+        self._distribuciones = []
         self.conexion = None
         self.canal = None
+        self.rng = np.random.default_rng()
 
     # ------------------- MÉTODOS PRINCIPALES -------------------
 
@@ -55,7 +96,13 @@ class MonteCarloProductor:
         """Establece conexión con RabbitMQ y crea las colas necesarias."""
         print("Conectando con RabbitMQ...")
         cred = pika.PlainCredentials(self.usuario, self.contrasena)
-        params = pika.ConnectionParameters(host=self.host, credentials=cred)
+        # pika ya desactiva Nagle (TCP_NODELAY); aquí se acotan los tiempos de espera de red.
+        # El heartbeat se deja al valor del bróker: la conexión queda inactiva mientras
+        # se pregunta al usuario cuántos escenarios generar.
+        params = pika.ConnectionParameters(
+            host=self.host, credentials=cred,
+            tcp_options={"TCP_USER_TIMEOUT": 30000}, socket_timeout=5
+        )
         self.conexion = pika.BlockingConnection(params)
         self.canal = self.conexion.channel()
 
@@ -76,12 +123,18 @@ class MonteCarloProductor:
         contenido = self.archivo_modelo.read_text(encoding="utf-8").strip()
 
         try:
-            self.modelo = json.loads(contenido)
+            self.modelo = orjson.loads(contenido)
             print("Modelo en formato JSON cargado correctamente.")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print("El archivo no está en formato JSON. Intentando analizar texto...")
             self.modelo = self._parsear_modelo(contenido)
 
+        # Analizar cada distribución una sola vez: (variable, generador, argumentos)
+        distros = self.modelo.get("variables", self.modelo.get("distributions", {}))
+        self._distribuciones = [
+            (var, *self._parsear_distribucion(expr)) for var, expr in distros.items()
+        ]
+
         return self.modelo
 
     def publicar_modelo(self):
@@ -90,7 +143,7 @@ class MonteCarloProductor:
         self.canal.basic_publish(
             exchange='',
             routing_key='model_queue',
-            body=json.dumps(self.modelo),
+            body=orjson.dumps(self.modelo),
             properties=pika.BasicProperties(expiration='60000')  # 60 segundos de validez
         )
         print("Modelo publicado correctamente.")
@@ -99,32 +152,54 @@ class MonteCarloProductor:
         """
         Genera una lista de escenarios basados en las distribuciones
         definidas en el modelo. Cada escenario es un diccionario de variables.
+        Los valores de cada variable se muestrean como una columna completa.
         """
+        cantidad = max(cantidad, 0)
         print(f"Generando {cantidad} escenarios...")
-        distros = self.modelo.get("variables", self.modelo.get("distributions", {}))
-        escenarios = []
 
-        for _ in range(cantidad):
-            escenario = {}
-            for var, expr in distros.items():
-                escenario[var] = self._evaluar_distribucion(expr)
-            escenarios.append(escenario)
+        if self._distribuciones:
+            nombres = [var for var, _, _ in self._distribuciones]
+            columnas = [
+                generador(self.rng, *args, size=cantidad).tolist()
+                for _, generador, args in self._distribuciones
+            ]
+            escenarios = [dict(zip(nombres, fila)) for fila in zip(*columnas)]
+        else:
+            escenarios = [{} for _ in range(cantidad)]
 
         print("Escenarios generados correctamente.")
         return escenarios
 
     def publicar_escenarios(self, escenarios):
-        """Publica los escenarios generados en la cola 'scenario_queue'."""
-        print(f"Publicando {len(escenarios)} escenarios en la cola 'scenario_queue'...")
-        for i, esc in enumerate(escenarios, 1):
-            self.canal.basic_publish(
-                exchange="",
-                routing_key="scenario_queue",
-                body=json.dumps(esc),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            if i % 10 == 0 or i == len(escenarios):
-                print(f"   Escenarios enviados: {i}/{len(escenarios)}")
+        """
+        Publica los escenarios generados en la cola 'scenario_queue'.
+        Cada mensaje es una lista JSON de hasta ESCENARIOS_POR_MENSAJE escenarios;
+        en tandas pequeñas los paquetes se achican hasta repartirse en unos
+        MENSAJES_MINIMOS mensajes, para que el trabajo llegue a varios consumidores.
+        Usa un canal transaccional propio: las publicaciones se envían sin
+        esperar respuesta y el bróker confirma cada LOTE_PUBLICACION de una vez.
+        """
+        total = len(escenarios)
+        print(f"Publicando {total} escenarios en la cola 'scenario_queue'...")
+        tamano = max(1, min(ESCENARIOS_POR_MENSAJE, math.ceil(total / MENSAJES_MINIMOS)))
+        canal = self.conexion.channel()
+        canal.tx_select()
+        try:
+            inicios = range(0, total, tamano)
+            for i, inicio in enumerate(inicios, 1):
+                paquete = escenarios[inicio:inicio + tamano]
+                canal.basic_publish(
+                    exchange="",
+                    routing_key="scenario_queue",
+                    body=orjson.dumps(paquete),
+                    properties=PROPIEDADES_ESCENARIO
+                )
+                if i % LOTE_PUBLICACION == 0 or i == len(inicios):
+                    canal.tx_commit()
+                    enviados = min(inicio + tamano, total)
+                    print(f"   Escenarios enviados: {enviados}/{total}")
+        finally:
+            canal.close()
         print("Todos los escenarios fueron publicados correctamente.")
 
     def cerrar(self):
@@ -164,30 +239,28 @@ class MonteCarloProductor:
 
         return secciones
 
-    def _evaluar_distribucion(self, expresion):
+    def _parsear_distribucion(self, expresion):
         """
-        Evalúa una expresión de distribución y devuelve un valor aleatorio.
+        Analiza una expresión de distribución y devuelve la función generadora
+        junto con la tupla de parámetros con que debe invocarse.
         Soporta: uniform(a,b), normal(mu,sigma), triangular(a,b,c), constante(x)
+        y las mismas distribuciones en formato de lista, p. ej. ["uniforme", a, b]
         """
         if isinstance(expresion, list):
-            # Compatibilidad con formato JSON tipo ["constante", valor]
-            if expresion[0] == "constante":
-                return float(expresion[1])
-
-        if m := re.match(r"uniform\(([^,]+),\s*([^)]+)\)", expresion):
-            a, b = map(float, m.groups())
-            return np.random.uniform(a, b)
-        elif m := re.match(r"normal\(([^,]+),\s*([^)]+)\)", expresion):
-            mu, sigma = map(float, m.groups())
-            return np.random.normal(mu, sigma)
-        elif m := re.match(r"triangular\(([^,]+),\s*([^,]+),\s*([^)]+)\)", expresion):
-            izq, pico, der = map(float, m.groups())
-            return np.random.triangular(izq, pico, der)
-        elif m := re.match(r"constante\(([^)]+)\)", expresion):
-            return float(m.group(1))
-        else:
+            nombre = _NOMBRES_LISTA.get(expresion[0]) if expresion else None
+            parametros = expresion[1:]
+            if nombre is None or len(parametros) != _PATRONES_DISTRIBUCION[nombre].groups:
+                raise ValueError(f"Distribución no reconocida: {expresion}")
+            return _GENERADORES_DISTRIBUCION[nombre], tuple(map(float, parametros))
+
+        nombre, _, argumentos = expresion.partition("(")
+        patron = _PATRONES_DISTRIBUCION.get(nombre)
+        m = patron.match(argumentos) if patron else None
+        if m is None:
             raise ValueError(f"Distribución no reconocida: {expresion}")
 
+        return _GENERADORES_DISTRIBUCION[nombre], tuple(map(float, m.groups()))
+
 # ------------------- EJECUCIÓN PRINCIPAL -------------------
 
 if __name__ == "__main__":